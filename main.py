@@ -1,10 +1,26 @@
 import os
 import time
-import json
-import tempfile
-from flask import Flask, request, send_file, jsonify
+import hashlib
+import math
+import io
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache, cached
+from flask import Flask, request, redirect, send_file, jsonify, make_response, url_for
+from flask.json.provider import JSONProvider
+from markupsafe import escape
+import google.auth
+import google.auth.credentials
+from google.auth.transport.requests import AuthorizedSession
+from google.api_core import exceptions as gcp_exceptions
+from google.api_core import retry
 from google.cloud import storage
 import google.generativeai as genai
+import orjson
+from PIL import ExifTags, Image, ImageOps
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Load API key from environment variable (do not hardcode)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")  # Ensure this is set in your environment
@@ -18,41 +34,323 @@ PROJECT_ID = "project2-452119"
 BUCKET_NAME = "project2-452119-bucket"
 REGION = "us-central1"
 
+# How long (in seconds) bucket listings are served from memory before re-listing
+LIST_CACHE_TTL = 30
+
+# Worker threads for background captioning and other concurrent network calls (GCS, Gemini)
+EXECUTOR_MAX_WORKERS = 8
+
+# Number of JSON metadata documents kept in memory for / and /view, and how long (in seconds) each is trusted.
+# Other worker processes can't invalidate this process's copy, so the TTL bounds how stale a re-upload can look.
+METADATA_CACHE_SIZE = 512
+METADATA_CACHE_TTL = 60
+
+# How long (in seconds) a missing metadata document is remembered, so images without one don't cost a GCS GET on
+# every page load; kept short because the caption job that writes it may run in another worker process
+METADATA_MISS_TTL = 5
+
+# Worker threads for fetching the metadata of every listed image in parallel on /
+METADATA_PREFETCH_WORKERS = 16
+
+# Bucket prefix under which generated captions are cached, keyed by image SHA-256
+CAPTION_CACHE_PREFIX = "caption_cache/"
+
+# Largest accepted upload; each queued caption job holds the whole image in memory
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+
+# Caption jobs (queued or running) allowed per process; uploads beyond this are rejected until the queue drains
+CAPTION_QUEUE_MAX = 32
+
+# Lifetime of the signed URLs /files and /json redirect to
+SIGNED_URL_EXPIRATION = timedelta(minutes=15)
+
+# Cache-Control for uploaded images and metadata. Objects are keyed by the client's filename and a re-upload
+# overwrites them, so browsers and the GCS edge cache may only hold them briefly.
+OBJECT_CACHE_CONTROL = "public, max-age=300"
+
+# Cache-Control for the /view page, kept short so new captions show up soon after they're written
+VIEW_CACHE_CONTROL = "public, max-age=60"
+
+# Cache-Control for /files and /json redirects; must expire well before the signed URL does
+SIGNED_URL_CACHE_CONTROL = "private, max-age=600"
+
+# HTTP connection pool sizing for the shared Cloud Storage session
+STORAGE_POOL_CONNECTIONS = 32
+STORAGE_POOL_MAXSIZE = 64
+
+# Maximum number of Gemini requests in flight at once per process
+GEMINI_MAX_CONCURRENCY = 5
+
+# Gemini model and prompt used for captioning
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+GEMINI_PROMPT = "describe the image. end your response in json"
+
+# Optional: generation configuration for the Gemini model, if needed
+GENERATION_CONFIG = {
+    "temperature": 1,
+    "top_p": 0.95,
+    "top_k": 64,
+    "max_output_tokens": 8192,
+    "response_mime_type": "application/json",
+}
+
+# Longest edge (in pixels) and JPEG quality of the copy of each image sent to Gemini
+GEMINI_MAX_IMAGE_EDGE = 1024
+GEMINI_JPEG_QUALITY = 85
+
+# Largest image sent inline in the request. Gemini caps a whole generateContent request at 20 MB; the default
+# gRPC transport sends the bytes raw, so this just leaves headroom for the prompt and request framing.
+GEMINI_INLINE_MAX_BYTES = 15 * 1024 * 1024
+
+# Upper bound (in seconds) on a single generate_content attempt, so a hung call can't hold a semaphore slot forever
+GEMINI_REQUEST_TIMEOUT = 30
+
+# Overall deadline (in seconds) for retrying one Gemini call
+GEMINI_RETRY_DEADLINE = 60.0
+
+# Retry rate-limited (429) and transient server-side (5xx) Gemini errors with exponential backoff
+GEMINI_RETRY = retry.Retry(
+    predicate=retry.if_exception_type(
+        gcp_exceptions.TooManyRequests,
+        gcp_exceptions.ResourceExhausted,
+        gcp_exceptions.InternalServerError,
+        gcp_exceptions.BadGateway,
+        gcp_exceptions.ServiceUnavailable,
+        gcp_exceptions.GatewayTimeout,
+    ),
+    initial=1.0,
+    multiplier=2.0,
+    maximum=16.0,
+    timeout=GEMINI_RETRY_DEADLINE,
+)
+
+# How long after an image is uploaded /view keeps polling for its caption before giving up. Worst case, a job
+# waits behind a full queue draining GEMINI_MAX_CONCURRENCY at a time, and each call runs until its retry
+# deadline plus one last attempt's timeout; the margin covers the cache lookup and the metadata write.
+CAPTION_WRITE_MARGIN = 30
+CAPTION_PENDING_WINDOW = timedelta(seconds=(
+    math.ceil(CAPTION_QUEUE_MAX / GEMINI_MAX_CONCURRENCY) * (GEMINI_RETRY_DEADLINE + GEMINI_REQUEST_TIMEOUT)
+    + CAPTION_WRITE_MARGIN
+))
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider that uses orjson for jsonify and request JSON parsing."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 
-# Initialize Google Cloud Storage client
-storage_client = storage.Client()
+# Home page template, compiled once at import rather than rebuilt on every request
+_INDEX_TEMPLATE = app.jinja_env.from_string("""
+    <html>
+      <head>
+        <title>Image Upload and Description</title>
+      </head>
+      <body style="background-color: {{ background_color }};">
+        <h2>Upload a JPEG Image</h2>
+        <form method="post" enctype="multipart/form-data" action="/upload">
+          <label>Choose file:</label>
+          <input type="file" name="form_file" accept="image/jpeg"/>
+          <button>Upload</button>
+        </form>
+        <hr>
+        <h2>Uploaded Images</h2>
+        <ul>
+        {% for file, json_file, metadata in images %}
+          <li><a href="{{ url_for('view_file', filename=file) }}">{{ file }}</a>{% if metadata %} - {{ metadata.title }}{% endif %} | <a href="{{ url_for('get_file', filename=file) }}">Download</a> | <a href="{{ url_for('get_json_file', filename=json_file) }}">JSON</a></li>
+        {% endfor %}
+        </ul>
+      </body>
+    </html>
+""")
+
+# Initialize Google Cloud Storage client once, on a pooled keep-alive session shared by every request
+credentials, _ = google.auth.default(scopes=storage.Client.SCOPE)
+storage_session = AuthorizedSession(credentials)
+storage_session.mount("https://", HTTPAdapter(
+    pool_connections=STORAGE_POOL_CONNECTIONS,
+    pool_maxsize=STORAGE_POOL_MAXSIZE,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+))
+storage_client = storage.Client(project=PROJECT_ID, credentials=credentials, _http=storage_session)
+
+# Set once URL signing has failed, so /files and /json stop retrying it and stream instead
+_SIGNING_UNAVAILABLE = threading.Event()
+
+# In-process cache of bucket listings, keyed by bucket name
+_LIST_CACHE = TTLCache(maxsize=4, ttl=LIST_CACHE_TTL)
+# TTLCache isn't thread-safe; every access, including invalidation, goes through this lock
+_LIST_CACHE_LOCK = threading.Lock()
+
+# In-process cache of JSON metadata documents, keyed by JSON filename
+_METADATA_CACHE = TTLCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+# JSON filenames recently found not to exist; shares the metadata cache's lock
+_METADATA_MISS_CACHE = TTLCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_MISS_TTL)
+_METADATA_CACHE_LOCK = threading.Lock()
+
+# Caps concurrent Gemini calls so bursts of uploads don't trip the API rate limit
+_GEMINI_SEMAPHORE = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+# Initialize the Gemini model once; it is reused by every caption request
+_GEMINI_MODEL = genai.GenerativeModel(
+    model_name=GEMINI_MODEL_NAME,
+    # generation_config=GENERATION_CONFIG,
+)
+
+# Shared thread pool that runs captioning off the request path
+executor = ThreadPoolExecutor(max_workers=EXECUTOR_MAX_WORKERS)
+
+# One slot per queued or running caption job; bounds the executor's otherwise unbounded queue
+_CAPTION_SLOTS = threading.BoundedSemaphore(CAPTION_QUEUE_MAX)
+
+# Separate pool for home-page metadata fetches, so page loads never queue behind captioning
+metadata_executor = ThreadPoolExecutor(max_workers=METADATA_PREFETCH_WORKERS)
 
 ### Cloud Storage Functions ###
-def upload_blob(bucket_name, source_file, destination_blob):
-    """Uploads a file to Google Cloud Storage."""
+def upload_bytes(bucket_name, data, destination_blob, content_type="image/jpeg"):
+    """Uploads in-memory bytes to Google Cloud Storage."""
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(destination_blob)
-    blob.upload_from_filename(source_file)
+    # Stored as object metadata, so GCS sends it on public and signed URL downloads
+    blob.cache_control = OBJECT_CACHE_CONTROL
+    blob.upload_from_string(data, content_type=content_type)
     print(f"Uploaded {destination_blob} to bucket {bucket_name}.")
 
-def download_blob(bucket_name, source_blob_name, destination_file_name):
-    """Downloads a file from Google Cloud Storage."""
+@cached(_LIST_CACHE, key=lambda bucket_name: bucket_name, lock=_LIST_CACHE_LOCK)
+def list_blobs(bucket_name):
+    """Lists all blobs (files) in the Cloud Storage bucket, cached for LIST_CACHE_TTL seconds."""
     bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(source_blob_name)
-    if not blob.exists():
-        print(f"File {source_blob_name} not found in bucket {bucket_name}.")
+    # Filter server-side and only ask for object names, not full object resources
+    blobs = bucket.list_blobs(match_glob="**{.jpeg,.jpg}", fields="items(name),nextPageToken")
+    return [blob.name for blob in blobs]
+
+@cached(_METADATA_CACHE, key=lambda json_filename: json_filename, lock=_METADATA_CACHE_LOCK)
+def _load_metadata(json_filename):
+    """Loads an image's JSON metadata from Cloud Storage; raises NotFound, which isn't cached."""
+    blob = storage_client.bucket(BUCKET_NAME).blob(json_filename)
+    return orjson.loads(blob.download_as_bytes())
+
+def _get_metadata(json_filename):
+    """Returns an image's JSON metadata, or None if it hasn't been written yet or can't be read."""
+    with _METADATA_CACHE_LOCK:
+        if json_filename in _METADATA_MISS_CACHE:
+            return None
+    try:
+        return _load_metadata(json_filename)
+    except gcp_exceptions.NotFound:
+        with _METADATA_CACHE_LOCK:
+            _METADATA_MISS_CACHE[json_filename] = True
+        return None
+    except Exception as e:
+        # One unreadable or malformed document shouldn't take down the whole listing
+        print(f"Error loading metadata {json_filename}: {e}")
         return None
-    blob.download_to_filename(destination_file_name)
-    print(f"Downloaded {source_blob_name} to {destination_file_name}")
-    return destination_file_name
 
-def list_blobs(bucket_name):
-    """Lists all blobs (files) in the Cloud Storage bucket."""
-    bucket = storage_client.bucket(bucket_name)
-    return [blob.name for blob in bucket.list_blobs() if blob.name.endswith((".jpeg", ".jpg"))]
+def _get_metadata_many(json_filenames):
+    """Returns the metadata (or None) for each JSON filename, fetching only uncached ones, in parallel."""
+    with _METADATA_CACHE_LOCK:
+        found = {
+            name: _METADATA_CACHE.get(name)
+            for name in json_filenames
+            if name in _METADATA_CACHE or name in _METADATA_MISS_CACHE
+        }
+    misses = list(dict.fromkeys(name for name in json_filenames if name not in found))
+    found.update(zip(misses, metadata_executor.map(_get_metadata, misses)))
+    return [found[name] for name in json_filenames]
+
+def _caption_pending(filename):
+    """Returns True if the image was uploaded recently enough that its caption may still be on the way."""
+    blob = storage_client.bucket(BUCKET_NAME).get_blob(filename)
+    return blob is not None and datetime.now(timezone.utc) - blob.time_created < CAPTION_PENDING_WINDOW
+
+def get_cached_caption(digest):
+    """Returns the caption previously generated for an image with this SHA-256 digest, or None."""
+    blob = storage_client.bucket(BUCKET_NAME).blob(f"{CAPTION_CACHE_PREFIX}{digest}.json")
+    try:
+        return orjson.loads(blob.download_as_bytes())
+    except gcp_exceptions.NotFound:
+        return None
+    except Exception as e:
+        # The cache is only an optimization; an unreadable or corrupt entry counts as a miss
+        print(f"Error reading cached caption {digest}: {e}")
+        return None
+
+def cache_caption(digest, metadata):
+    """Stores a generated caption under the image's SHA-256 digest for reuse by later uploads."""
+    blob = storage_client.bucket(BUCKET_NAME).blob(f"{CAPTION_CACHE_PREFIX}{digest}.json")
+    try:
+        blob.upload_from_string(orjson.dumps(metadata), content_type="application/json")
+    except Exception as e:
+        # Skip the cache write rather than lose a caption that has already been generated
+        print(f"Error caching caption {digest}: {e}")
+
+def generate_download_url(blob, filename):
+    """Returns a short-lived V4 signed URL that downloads the blob directly from Cloud Storage, or None if signing isn't possible."""
+    if _SIGNING_UNAVAILABLE.is_set():
+        return None
+    sign_kwargs = {}
+    try:
+        if not isinstance(credentials, google.auth.credentials.Signing):
+            # User credentials (local `gcloud auth application-default login`) can't sign at all
+            if not hasattr(credentials, "service_account_email"):
+                raise ValueError("credentials can't sign URLs")
+            # Token-only service account credentials (e.g. the runtime service account) sign through the IAM API,
+            # which needs roles/iam.serviceAccountTokenCreator on that service account. The token is kept fresh
+            # by storage_session, which just used it for the existence check; don't refresh it from here.
+            if not credentials.valid:
+                return None
+            sign_kwargs = {"service_account_email": credentials.service_account_email, "access_token": credentials.token}
+        return blob.generate_signed_url(
+            version="v4",
+            expiration=SIGNED_URL_EXPIRATION,
+            response_disposition=f'attachment; filename="{filename}"',
+            **sign_kwargs,
+        )
+    except Exception as e:
+        # Don't pay for a failing signing attempt on every download; stream for the rest of this process
+        _SIGNING_UNAVAILABLE.set()
+        print(f"Error signing download URL for {blob.name}, streaming downloads from now on: {e}")
+        return None
+
+def stream_blob(blob, filename, mimetype=None):
+    """Streams a blob through Flask as a download, with the same caching headers GCS would send."""
+    response = send_file(blob.open("rb"), as_attachment=True, download_name=filename, mimetype=mimetype)
+    response.headers["Cache-Control"] = OBJECT_CACHE_CONTROL
+    response.set_etag(blob.md5_hash or blob.etag)
+    # Answers If-None-Match with a 304 before any of the blob is read
+    return response.make_conditional(request)
 
 ### Gemini AI Functions ###
-def upload_to_gemini(path, mime_type="image/jpeg"):
-    """Uploads an image file to Gemini AI and returns the uploaded file object."""
+def downscale_for_gemini(image_bytes):
+    """Uprights an image per its EXIF orientation, shrinks it to at most GEMINI_MAX_IMAGE_EDGE pixels on its
+    longest edge and re-encodes it as JPEG."""
     try:
-        file = genai.upload_file(path, mime_type=mime_type)
+        img = Image.open(io.BytesIO(image_bytes))
+        # Phone photos are often stored sideways with an orientation tag, which re-encoding would drop
+        needs_rotation = img.getexif().get(ExifTags.Base.Orientation, 1) != 1
+        if max(img.size) <= GEMINI_MAX_IMAGE_EDGE and not needs_rotation:
+            return image_bytes
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((GEMINI_MAX_IMAGE_EDGE, GEMINI_MAX_IMAGE_EDGE), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, "JPEG", quality=GEMINI_JPEG_QUALITY, optimize=True)
+        return buf.getvalue()
+    except Exception as e:
+        # Fall back to the original bytes; Gemini can still caption a full-size image
+        print(f"Error downscaling image for Gemini AI: {e}")
+        return image_bytes
+
+def upload_to_gemini(image_bytes, mime_type="image/jpeg"):
+    """Uploads image bytes to Gemini AI and returns the uploaded file object."""
+    try:
+        file = genai.upload_file(io.BytesIO(image_bytes), mime_type=mime_type)
         if not file:
             raise ValueError("Upload failed: No file returned from Gemini AI.")
         print(f"Uploaded file '{file.display_name}' as: {file.uri}")
@@ -61,33 +359,25 @@ def upload_to_gemini(path, mime_type="image/jpeg"):
         print(f"Error uploading to Gemini AI: {e}")
         return None
 
-def generate_gemini_caption(image_path, mime_type="image/jpeg"):
+def generate_gemini_caption(image_bytes, mime_type="image/jpeg"):
     """Generates a title and description from the Gemini multimodal model."""
     try:
-        # Optional: define generation configuration if needed
-        generation_config = {
-            "temperature": 1,
-            "top_p": 0.95,
-            "top_k": 64,
-            "max_output_tokens": 8192,
-            "response_mime_type": "application/json",
-        }
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            # generation_config=generation_config,
-        )
-        # Define the prompt
-        PROMPT = "describe the image. end your response in json"
-        # Upload the image to Gemini and get the uploaded file object
-        gemini_file = upload_to_gemini(image_path, mime_type=mime_type)
-        if gemini_file is None:
-            return {"title": "Upload Failed", "description": "Could not generate description due to upload error."}
-        # Generate content using the model, mimicking your provided snippet
-        response = model.generate_content([
-            gemini_file,  # The uploaded file object
-            "\n\n",
-            PROMPT
-        ])
+        image_bytes = downscale_for_gemini(image_bytes)
+        with _GEMINI_SEMAPHORE:
+            if len(image_bytes) <= GEMINI_INLINE_MAX_BYTES:
+                # Send the image inline with the prompt, saving the separate File API upload
+                image_part = {"mime_type": mime_type, "data": image_bytes}
+            else:
+                # Upload the image to Gemini and get the uploaded file object
+                image_part = upload_to_gemini(image_bytes, mime_type=mime_type)
+                if image_part is None:
+                    return {"title": "Upload Failed", "description": "Could not generate description due to upload error."}
+            # Generate content using the model, mimicking your provided snippet
+            response = _GEMINI_MODEL.generate_content([
+                image_part,  # The inline image or uploaded file object
+                "\n\n",
+                GEMINI_PROMPT
+            ], request_options={"retry": GEMINI_RETRY, "timeout": GEMINI_REQUEST_TIMEOUT})
         # Debug: print response type and content
         print("Debug: Response type:", type(response))
         print("Debug: Response content:", response)
@@ -103,78 +393,114 @@ def generate_gemini_caption(image_path, mime_type="image/jpeg"):
         print(f"Error processing image with Gemini AI: {e}")
         return {"title": "Error", "description": "An error occurred while generating the description."}
 
+def caption_image(image_bytes, digest):
+    """Returns the caption for an image, calling Gemini only if this exact image hasn't been captioned before."""
+    metadata = get_cached_caption(digest)
+    if metadata is not None:
+        print(f"Caption cache hit for {digest}")
+        return metadata
+    metadata = generate_gemini_caption(image_bytes)
+    # Don't cache error placeholders, so a later upload of the same image gets another try
+    if metadata["title"] not in ("Error", "Upload Failed"):
+        cache_caption(digest, metadata)
+    return metadata
+
+def caption_task(filename, image_bytes):
+    """Background job: captions an uploaded image and stores its JSON metadata next to it in the bucket."""
+    try:
+        metadata = caption_image(image_bytes, hashlib.sha256(image_bytes).hexdigest())
+        json_filename = filename.rsplit('.', 1)[0] + ".json"
+        upload_bytes(BUCKET_NAME, orjson.dumps(metadata), json_filename, content_type="application/json")
+        # Drop any metadata cached for a previous upload under the same filename
+        with _METADATA_CACHE_LOCK:
+            _METADATA_CACHE.pop(json_filename, None)
+            _METADATA_MISS_CACHE.pop(json_filename, None)
+    except Exception as e:
+        print(f"Error captioning {filename}: {e}")
+
 ### Flask Routes ###
 @app.route('/')
 def index():
-    """Displays uploaded images with links to view, download, or get JSON metadata."""
+    """Displays uploaded images and their titles with links to view, download, or get JSON metadata."""
     # Retrieve background color from environment variable (set externally in deployment)
     background_color = os.environ.get("BACKGROUND_COLOR", "white")
-    index_html = f"""
-    <html>
-      <head>
-        <title>Image Upload and Description</title>
-      </head>
-      <body style="background-color: {background_color};">
-        <h2>Upload a JPEG Image</h2>
-        <form method="post" enctype="multipart/form-data" action="/upload">
-          <label>Choose file:</label>
-          <input type="file" name="form_file" accept="image/jpeg"/>
-          <button>Upload</button>
-        </form>
-        <hr>
-        <h2>Uploaded Images</h2>
-        <ul>
-    """
-    for file in list_blobs(BUCKET_NAME):
-        json_file = file.rsplit('.', 1)[0] + ".json"
-        index_html += f"<li><a href='/view/{file}'>{file}</a> | <a href='/files/{file}'>Download</a> | <a href='/json/{json_file}'>JSON</a></li>"
-    index_html += "</ul></body></html>"
-    return index_html
+    files = list_blobs(BUCKET_NAME)
+    json_files = [file.rsplit('.', 1)[0] + ".json" for file in files]
+    # Serve cached metadata directly and fetch the rest concurrently
+    metadata = _get_metadata_many(json_files)
+    images = zip(files, json_files, metadata)
+    return _INDEX_TEMPLATE.render(images=images, background_color=background_color)
 
 @app.route('/upload', methods=["POST"])
 def upload():
-    """Handles image upload, file storage, and Gemini AI caption generation."""
+    """Handles image upload and file storage, and queues Gemini AI caption generation."""
     file = request.files.get('form_file')
     if not file:
         return "<h3>Error: No file selected.</h3><a href='/'>Back to Upload</a>"
 
+    # Reserve a caption slot before storing anything, so a full queue rejects the upload cleanly
+    if not _CAPTION_SLOTS.acquire(blocking=False):
+        return "<h3>Error: Too many images are being processed. Try again shortly.</h3><a href='/'>Back to Upload</a>", 503
+
     filename = file.filename
-    with tempfile.NamedTemporaryFile(delete=False) as temp_img:
-        file.save(temp_img.name)
-        upload_blob(BUCKET_NAME, temp_img.name, filename)
+    try:
+        # Read the image once; the same bytes go to GCS and to the caption job, with no temp file
+        image_bytes = file.stream.read()
+        upload_bytes(BUCKET_NAME, image_bytes, filename)
+    except Exception:
+        _CAPTION_SLOTS.release()
+        raise
 
-    metadata = generate_gemini_caption(temp_img.name)
-    json_filename = filename.rsplit('.', 1)[0] + ".json"
-    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as temp_json:
-        json.dump(metadata, temp_json)
-        temp_json.seek(0)
-        upload_blob(BUCKET_NAME, temp_json.name, json_filename)
+    # Caption in the background once the image is stored; only the upload holds up the response
+    caption_future = executor.submit(caption_task, filename, image_bytes)
+    caption_future.add_done_callback(lambda _: _CAPTION_SLOTS.release())
+    # Drop the cached listing so the new image shows up on the next page load
+    with _LIST_CACHE_LOCK:
+        _LIST_CACHE.pop(BUCKET_NAME, None)
 
+    # The filename comes straight from the client, so URL-quote it for links and escape it for display
+    view_url = escape(url_for('view_file', filename=filename))
     return f"""
-    <h2>Title: {metadata['title']}</h2>
-    <p>Description: {metadata['description']}</p>
-    <a href='/'>Back to Upload</a>
+    <html>
+      <head>
+        <meta http-equiv="refresh" content="3;url={view_url}">
+      </head>
+      <body>
+        <h2>Uploaded {escape(filename)}</h2>
+        <p>Generating a title and description...</p>
+        <a href="{view_url}">View image</a> | <a href='/'>Back to Upload</a>
+      </body>
+    </html>
     """
 
 @app.route('/files/<filename>')
 def get_file(filename):
-    """Fetches an image file from Google Cloud Storage for download."""
-    temp_file = tempfile.NamedTemporaryFile(delete=False)
-    result = download_blob(BUCKET_NAME, filename, temp_file.name)
-    if result:
-        return send_file(temp_file.name, as_attachment=True)
-    else:
+    """Redirects to a signed Cloud Storage URL so the image downloads directly from GCS."""
+    # get_blob is the same single request as exists(), but also loads the hash used for the ETag
+    blob = storage_client.bucket(BUCKET_NAME).get_blob(filename)
+    if blob is None:
         return "<h3>Error: File not found.</h3>", 404
+    url = generate_download_url(blob, filename)
+    if url is None:
+        # These credentials can't sign URLs, so stream the image through Flask instead
+        return stream_blob(blob, filename)
+    response = redirect(url)
+    response.headers["Cache-Control"] = SIGNED_URL_CACHE_CONTROL
+    return response
 
 @app.route('/json/<filename>')
 def get_json_file(filename):
-    """Fetches a JSON metadata file from Google Cloud Storage for download."""
-    temp_file = tempfile.NamedTemporaryFile(delete=False)
-    result = download_blob(BUCKET_NAME, filename, temp_file.name)
-    if result:
-        return send_file(temp_file.name, as_attachment=True, mimetype="application/json")
-    else:
+    """Redirects to a signed Cloud Storage URL so the JSON metadata downloads directly from GCS."""
+    blob = storage_client.bucket(BUCKET_NAME).get_blob(filename)
+    if blob is None:
         return jsonify({"error": "File not found"}), 404
+    url = generate_download_url(blob, filename)
+    if url is None:
+        # These credentials can't sign URLs, so stream the JSON through Flask instead
+        return stream_blob(blob, filename, mimetype="application/json")
+    response = redirect(url)
+    response.headers["Cache-Control"] = SIGNED_URL_CACHE_CONTROL
+    return response
 
 @app.route('/view/<filename>')
 def view_file(filename):
@@ -186,18 +512,21 @@ def view_file(filename):
     image_url = f"https://storage.googleapis.com/{BUCKET_NAME}/{filename}"
     # Build the JSON filename
     json_filename = filename.rsplit('.', 1)[0] + ".json"
-    # Download the JSON file into a temporary file and load the metadata
-    temp_json = tempfile.NamedTemporaryFile(delete=False)
-    result = download_blob(BUCKET_NAME, json_filename, temp_json.name)
-    if result:
-        with open(temp_json.name, "r") as f:
-            metadata = json.load(f)
-    else:
+    # Load the metadata straight into memory (served from cache on repeat views)
+    metadata = _get_metadata(json_filename)
+    # Metadata is written by the background caption job; poll by refreshing the page while it may still arrive
+    refresh = ""
+    if metadata is None and _caption_pending(filename):
+        metadata = {"title": "Processing", "description": "The description is still being generated."}
+        refresh = '<meta http-equiv="refresh" content="3">'
+    elif metadata is None:
+        # The job failed, was lost to a worker restart, or the image predates captioning
         metadata = {"title": "No Title", "description": "No description available."}
     # Render an HTML page with the image and its description
     html = f"""
     <html>
       <head>
+        {refresh}
         <title>{metadata.get('title', 'Image')}</title>
       </head>
       <body>
@@ -208,7 +537,15 @@ def view_file(filename):
       </body>
     </html>
     """
-    return html
+    response = make_response(html)
+    if refresh:
+        # Don't let the placeholder page be cached while the caption is still being generated
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    response.headers["Cache-Control"] = VIEW_CACHE_CONTROL
+    response.add_etag()
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    # Local development only; production runs under gunicorn (see procfile)
+    app.run(host='0.0.0.0', port=8080, debug=os.environ.get("FLASK_DEBUG") == "1")
\ No newline at end of file